@@ -5,19 +5,28 @@ Downloads files by recursively following links based on search patterns.
 """
 
 import argparse
+import heapq
+import itertools
+import multiprocessing
 import os
+import queue
 import re
+import shutil
+import socket
 import sys
 import time
-import random
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from queue import Queue
-from urllib.parse import urljoin, urlparse, unquote
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from urllib.parse import urljoin, urlparse, urlunparse, unquote
 
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.dammit import EncodingDetector
 from dotenv import dotenv_values
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Additional imports for xpath support (optional)
 try:
@@ -27,6 +36,13 @@ try:
 except ImportError:
     LXML_AVAILABLE = False
 
+# Without lxml, only build the anchors when parsing pages with BeautifulSoup
+LINK_STRAINER = SoupStrainer("a", href=True)
+# Bytes of HTML fed to the lxml parser at a time
+PARSE_CHUNK = 64 * 1024
+# Pages at least this large are parsed in a separate process
+PROCESS_PARSE_MIN = 512 * 1024
+
 # Load environment variables
 env = {
     k: v
@@ -39,6 +55,7 @@ env = {
 # Selenium imports (optional)
 try:
     from selenium import webdriver
+    from selenium.common.exceptions import TimeoutException
     from selenium.webdriver.chrome.options import Options as ChromeOptions
     from selenium.webdriver.firefox.options import Options as FirefoxOptions
     from selenium.webdriver.common.by import By
@@ -49,23 +66,277 @@ try:
 except ImportError:
     SELENIUM_AVAILABLE = False
 
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+# Headers sent with every request, set once on the session
+DEFAULT_BROWSER_HEADERS = {
+    "User-Agent": USER_AGENT,
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Accept-Encoding": "gzip, deflate, br",
+    "DNT": "1",
+    "Connection": "keep-alive",
+    "Upgrade-Insecure-Requests": "1",
+    "Sec-Fetch-Dest": "document",
+    "Sec-Fetch-Mode": "navigate",
+    "Sec-Fetch-Site": "none",
+    "Sec-Fetch-User": "?1",
+    "Cache-Control": "max-age=0",
+}
+# Overrides for file downloads, None removes a default header
+DOWNLOAD_HEADERS = {
+    "Accept": "*/*",
+    "Sec-Fetch-Site": "same-origin",
+    "Upgrade-Insecure-Requests": None,
+    "Sec-Fetch-User": None,
+    "Cache-Control": None,
+}
+
+# Size of each read/write when saving downloads
+DOWNLOAD_CHUNK = int(env.get("CHUNK_SIZE", 1 << 20))
+# Files at least this large are downloaded as concurrent byte ranges
+RANGE_DOWNLOAD_MIN = 16 * 1024 * 1024
+# Most byte ranges, and so connections, used for a single file
+RANGE_SEGMENTS_MAX = 4
+# Page cache hints for downloaded files (Linux and some other Unixes)
+FADVISE_AVAILABLE = hasattr(os, "posix_fadvise")
+# Downloads at least this large are flushed and dropped from the page cache
+DROP_CACHE_MIN = 16 * 1024 * 1024
+
+# Characters that are not allowed in filenames
+_FILENAME_SANITIZE_RE = re.compile(r'[<>:"/\\|?*]')
+_WHITESPACE_RE = re.compile(r"\s+")
+_CONTENT_RANGE_RE = re.compile(r"bytes (\d+)-(\d+)/")
+
 # Global variables
 session = requests.Session()
+session.headers.update(DEFAULT_BROWSER_HEADERS)
+
+
+def configure_session(max_workers=4):
+    """Size the session's connection pool so every worker keeps a live connection"""
+    adapter = HTTPAdapter(
+        pool_connections=32,
+        pool_maxsize=max(64, max_workers * 4),
+        max_retries=Retry(
+            total=3, backoff_factor=0.5, status_forcelist=[429, 502, 503, 504]
+        ),
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+
+# The resolver replaced by install_dns_cache, while the cache is installed
+_original_getaddrinfo = None
+
+
+def install_dns_cache():
+    """Resolve each host once per run instead of on every new connection"""
+    global _original_getaddrinfo
+    if _original_getaddrinfo is not None:
+        return
+    resolve = _original_getaddrinfo = socket.getaddrinfo
+
+    @lru_cache(maxsize=1024)
+    def cached_getaddrinfo(host, port, family=0, type=0, proto=0, flags=0):
+        return tuple(resolve(host, port, family, type, proto, flags))
+
+    socket.getaddrinfo = cached_getaddrinfo
+
+
+def uninstall_dns_cache():
+    """Put back the resolver replaced by install_dns_cache"""
+    global _original_getaddrinfo
+    if _original_getaddrinfo is not None:
+        socket.getaddrinfo = _original_getaddrinfo
+        _original_getaddrinfo = None
+
+
 # Configure session for better concurrency and reliability
-session.headers.update(
-    {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-    }
-)
-# Set connection pooling for better concurrent performance
-adapter = requests.adapters.HTTPAdapter(
-    pool_connections=20, pool_maxsize=20, max_retries=3
-)
-session.mount("http://", adapter)
-session.mount("https://", adapter)
-
-browser_pool = Queue()
+configure_session()
+
+# Browsers are retired after this many pages or this many idle seconds, so
+# long crawls don't accumulate ever-growing browser processes
+BROWSER_MAX_USES = 50
+BROWSER_MAX_IDLE = 300
 verbose_mode = False
+head_mode = False
+# Concurrent byte ranges per large download, set from --workers and capped
+# at RANGE_SEGMENTS_MAX
+download_segments = 4
+# Extra seconds to wait after a browser page loads, for JavaScript-heavy sites
+js_wait = 0.0
+
+
+class HostRateLimiter:
+    """Token bucket rate limiter with a separate bucket for each host"""
+
+    def __init__(self, rate=1.0, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, host):
+        """Take a request slot for host without waiting
+
+        Returns how many seconds from now the request may be sent.
+        """
+        if self.rate <= 0:
+            return 0
+
+        with self._lock:
+            now = time.monotonic()
+            tokens, last = self._buckets.get(host, (self.burst, now))
+            # Refill, then take a token; a negative balance reserves a future slot
+            tokens = min(self.burst, tokens + (now - last) * self.rate) - 1
+            self._buckets[host] = (tokens, now)
+
+        return max(0, -tokens / self.rate)
+
+    def acquire(self, host):
+        """Wait until a request to host is allowed"""
+        delay = self.reserve(host)
+        if delay > 0:
+            time.sleep(delay)
+
+
+rate_limiter = HostRateLimiter()
+
+
+class BrowserPool:
+    """Bounded pool of browsers that recycles each one after heavy or idle use"""
+
+    def __init__(self, size=0, max_uses=BROWSER_MAX_USES, max_idle=BROWSER_MAX_IDLE):
+        self.size = size  # 0 for no limit
+        self.max_uses = max_uses
+        self.max_idle = max_idle
+        # Idle (driver, returned_at) pairs, last in first out so the most
+        # recently used (warmest) browser is reused
+        self._idle = []
+        self._uses = {}
+        self._count = 0
+        self._cond = threading.Condition()
+        self._launchers = []
+
+    def _pop_expired(self):
+        """Remove browsers idle for longer than max_idle, the caller quits them"""
+        cutoff = time.monotonic() - self.max_idle
+        expired = [driver for driver, returned in self._idle if returned < cutoff]
+        if expired:
+            self._idle = [entry for entry in self._idle if entry[1] >= cutoff]
+            for driver in expired:
+                self._uses.pop(driver, None)
+            self._count -= len(expired)
+        return expired
+
+    def acquire(self, browser_type, timeout=60):
+        """Get an idle browser, creating one only while the pool has room"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            expired = self._pop_expired()
+            while not self._idle and self.size and self._count >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    break
+            driver = self._idle.pop()[0] if self._idle else None
+            can_create = driver is None and (not self.size or self._count < self.size)
+            if can_create:
+                self._count += 1
+
+        for stale in expired:
+            quit_browser(stale)
+
+        if can_create:
+            driver = create_browser(browser_type)
+            if not driver:
+                with self._cond:
+                    self._count -= 1
+                    self._cond.notify()
+        elif driver is None and verbose_mode:
+            print("Timed out waiting for a browser")
+        return driver
+
+    def release(self, driver):
+        """Return a browser to the pool, quitting it once it has been used max_uses times"""
+        with self._cond:
+            uses = self._uses.get(driver, 0) + 1
+            retire = uses >= self.max_uses
+            if retire:
+                self._uses.pop(driver, None)
+                self._count -= 1
+            else:
+                self._uses[driver] = uses
+                self._idle.append((driver, time.monotonic()))
+            self._cond.notify()
+
+        if retire:
+            quit_browser(driver)
+
+    def prewarm(self, browser_type, count):
+        """Launch count browsers concurrently, returning once the first is ready
+
+        The rest keep starting in the background and join the pool as soon
+        as each is up, so the crawl doesn't wait for every browser.
+        """
+        with self._cond:
+            if self.size:
+                count = min(count, self.size - self._count)
+            self._count += count
+        if count <= 0:
+            return
+
+        for _ in range(count - 1):
+            launcher = threading.Thread(
+                target=self._launch, args=(browser_type,), daemon=True
+            )
+            launcher.start()
+            self._launchers.append(launcher)
+        self._launch(browser_type)
+
+    def _launch(self, browser_type):
+        """Create a browser for a slot already counted by prewarm"""
+        driver = create_browser(browser_type)
+        with self._cond:
+            if driver:
+                self._idle.append((driver, time.monotonic()))
+            else:
+                self._count -= 1
+            self._cond.notify()
+
+    def close(self):
+        """Quit every idle browser"""
+        # Let browsers still starting up join the pool, so they get quit too
+        for launcher in self._launchers:
+            launcher.join()
+        self._launchers = []
+        with self._cond:
+            drivers = [driver for driver, _ in self._idle]
+            self._idle = []
+            self._uses.clear()
+            self._count -= len(drivers)
+        for driver in drivers:
+            quit_browser(driver)
+
+
+browser_pool = BrowserPool()
+
+# Searches already done, keyed by (canonical URL, remaining patterns), and an
+# LRU cache of each page's links keyed by canonical URL
+PAGE_CACHE_SIZE = 256
+_visited = set()
+_visited_lock = threading.Lock()
+_page_cache = OrderedDict()
+_page_cache_lock = threading.Lock()
+
+# Processes for parsing large pages off the GIL, started on first use
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+# Output directories created during this run, mapped to the names of the
+# files in them so existing downloads are found without a stat per file
+_dir_files = {}
+_dir_files_lock = threading.Lock()
 
 
 def create_browser(browser_name="chrome"):
@@ -84,10 +355,18 @@ def create_browser(browser_name="chrome"):
             ]:
                 options.add_argument(arg)
             options.add_experimental_option("excludeSwitches", ["enable-automation"])
+            # Only the links are needed, so don't download images
+            options.add_experimental_option(
+                "prefs", {"profile.managed_default_content_settings.images": 2}
+            )
+            # Return from get() once the DOM is ready, not after every asset
+            options.page_load_strategy = "eager"
             driver = webdriver.Chrome(options=options)
         else:  # firefox
             options = FirefoxOptions()
             options.set_preference("dom.webdriver.enabled", False)
+            options.set_preference("permissions.default.image", 2)
+            options.page_load_strategy = "eager"
             driver = webdriver.Firefox(options=options)
 
         driver.execute_script(
@@ -99,21 +378,95 @@ def create_browser(browser_name="chrome"):
         return None
 
 
-def get_browser(browser_type):
-    """Get a browser from the pool or create a new one"""
+def quit_browser(driver):
+    """Quit a browser, ignoring errors from one that already died"""
     try:
-        return browser_pool.get_nowait()
-    except:
-        return create_browser(browser_type)
+        driver.quit()
+    except Exception:
+        pass
+
+
+def init_browser_pool(size, browser_type):
+    """Start a pool of size browsers, returning once the first one is ready"""
+    global browser_pool
+    browser_pool = BrowserPool(size)
+    browser_pool.prewarm(browser_type, size)
+
+
+def get_browser(browser_type):
+    """Get a browser from the pool"""
+    return browser_pool.acquire(browser_type)
+
+
+def return_browser(driver):
+    """Give a browser from get_browser back to the pool"""
+    browser_pool.release(driver)
 
 
 def cleanup_browsers():
     """Clean up all browsers in the pool"""
-    while not browser_pool.empty():
-        try:
-            browser_pool.get_nowait().quit()
-        except:
-            break
+    browser_pool.close()
+
+
+def canonicalize_url(url):
+    """Normalize a URL so that equivalent addresses share one cache key"""
+    parsed = urlparse(url)
+    return urlunparse(
+        (
+            parsed.scheme.lower(),
+            parsed.netloc.lower(),
+            parsed.path or "/",
+            parsed.params,
+            parsed.query,
+            "",
+        )
+    )
+
+
+def ensure_dir(path):
+    """Create a directory once per run and return the set of files in it"""
+    with _dir_files_lock:
+        files = _dir_files.get(path)
+        if files is None:
+            os.makedirs(path, exist_ok=True)
+            files = _dir_files[path] = {entry.name for entry in os.scandir(path)}
+        return files
+
+
+def claim_file(files, filename):
+    """Claim a file name in the set returned by ensure_dir for a download
+
+    Returns False if the file already exists or another download has
+    claimed it. Claims of failed downloads are given back with release_file.
+    """
+    with _dir_files_lock:
+        if filename in files:
+            return False
+        files.add(filename)
+        return True
+
+
+def release_file(files, filename):
+    """Give back a claim made with claim_file"""
+    with _dir_files_lock:
+        files.discard(filename)
+
+
+def wait_for_page(driver):
+    """Wait until the browser has finished parsing the current page"""
+    WebDriverWait(driver, 10).until(
+        EC.presence_of_element_located((By.TAG_NAME, "body"))
+    )
+    try:
+        # Browsers use the "eager" load strategy, so subresources may still be
+        # loading, but the DOM and its links are complete once parsing is done
+        WebDriverWait(driver, 5).until(
+            lambda d: d.execute_script("return document.readyState") != "loading"
+        )
+    except TimeoutException:
+        pass
+    if js_wait > 0:
+        time.sleep(js_wait)
 
 
 def normalize_xpath(xpath_expr):
@@ -130,6 +483,12 @@ def normalize_xpath(xpath_expr):
     return xpath_expr
 
 
+def clean_title(title):
+    """Clean a page title for use as a folder name"""
+    title = _FILENAME_SANITIZE_RE.sub("_", title)
+    return _WHITESPACE_RE.sub(" ", title).strip()
+
+
 def extract_title(
     url, xpath_expression, mode="requests", driver=None, browser_type="chrome"
 ):
@@ -148,23 +507,8 @@ def extract_title(
                 return None
 
             # Use lxml with requests
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
-                "Accept-Language": "en-US,en;q=0.9",
-                "Accept-Encoding": "gzip, deflate, br",
-                "DNT": "1",
-                "Connection": "keep-alive",
-                "Upgrade-Insecure-Requests": "1",
-                "Sec-Fetch-Dest": "document",
-                "Sec-Fetch-Mode": "navigate",
-                "Sec-Fetch-Site": "none",
-                "Sec-Fetch-User": "?1",
-                "Cache-Control": "max-age=0",
-            }
-
-            time.sleep(random.uniform(0.5, 1.5))
-            response = session.get(url, headers=headers, timeout=30)
+            rate_limiter.acquire(urlparse(url).netloc)
+            response = session.get(url, timeout=30)
             response.raise_for_status()
 
             # Parse with lxml
@@ -179,10 +523,7 @@ def extract_title(
                     title = str(elements[0]).strip()
 
                 if title:
-                    # Clean the title for use as folder name
-                    title = re.sub(r'[<>:"/\\|?*]', "_", title)
-                    title = re.sub(r"\s+", " ", title).strip()
-                    return title
+                    return clean_title(title)
 
         else:
             # Use selenium for chrome/firefox
@@ -194,10 +535,7 @@ def extract_title(
 
             try:
                 driver.get(url)
-                WebDriverWait(driver, 10).until(
-                    EC.presence_of_element_located((By.TAG_NAME, "body"))
-                )
-                time.sleep(1)
+                wait_for_page(driver)
 
                 # Use selenium's xpath finder
                 elements = driver.find_elements(By.XPATH, xpath_expression)
@@ -205,19 +543,14 @@ def extract_title(
                 if elements:
                     title = elements[0].text.strip()
                     if title:
-                        # Clean the title for use as folder name
-                        title = re.sub(r'[<>:"/\\|?*]', "_", title)
-                        title = re.sub(r"\s+", " ", title).strip()
-                        return title
-
-                if should_return:
-                    browser_pool.put(driver)
+                        return clean_title(title)
 
             except Exception as e:
                 if verbose_mode:
                     print(f"Error extracting title from {url}: {e}")
-                if should_return and driver:
-                    browser_pool.put(driver)
+            finally:
+                if should_return:
+                    return_browser(driver)
 
     except Exception as e:
         if verbose_mode:
@@ -226,29 +559,41 @@ def extract_title(
     return None
 
 
+def page_cached(url):
+    """Check whether get_page has the links on a page cached"""
+    with _page_cache_lock:
+        return canonicalize_url(url) in _page_cache
+
+
 def get_page(url, mode="requests", driver=None, browser_type="chrome"):
-    """Get page content using requests or selenium"""
+    """Get the links on a page, reusing a cached copy if it was already fetched"""
+    key = canonicalize_url(url)
+    with _page_cache_lock:
+        hrefs = _page_cache.get(key)
+        if hrefs is not None:
+            _page_cache.move_to_end(key)
+            return hrefs
+
+    hrefs = fetch_page(url, mode, driver, browser_type)
+    if hrefs is not None:
+        with _page_cache_lock:
+            _page_cache[key] = hrefs
+            if len(_page_cache) > PAGE_CACHE_SIZE:
+                _page_cache.popitem(last=False)
+    return hrefs
+
+
+def fetch_page(url, mode="requests", driver=None, browser_type="chrome"):
+    """Get the links on a page using requests or selenium
+
+    Requests aren't paced here, the crawl reserves a slot with rate_limiter
+    before it runs the search that fetches the page.
+    """
     try:
         if mode == "requests":
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
-                "Accept-Language": "en-US,en;q=0.9",
-                "Accept-Encoding": "gzip, deflate, br",
-                "DNT": "1",
-                "Connection": "keep-alive",
-                "Upgrade-Insecure-Requests": "1",
-                "Sec-Fetch-Dest": "document",
-                "Sec-Fetch-Mode": "navigate",
-                "Sec-Fetch-Site": "none",
-                "Sec-Fetch-User": "?1",
-                "Cache-Control": "max-age=0",
-            }
-            # Add a small random delay to avoid rate limiting
-            time.sleep(random.uniform(0.5, 1.5))
-            response = session.get(url, headers=headers, timeout=30)
+            response = session.get(url, timeout=30)
             response.raise_for_status()
-            return BeautifulSoup(response.content, "html.parser")
+            return parse_page(response.content, page_encoding(response))
         else:
             should_return = driver is None
             if not driver:
@@ -258,68 +603,176 @@ def get_page(url, mode="requests", driver=None, browser_type="chrome"):
 
             try:
                 driver.get(url)
-                WebDriverWait(driver, 10).until(
-                    EC.presence_of_element_located((By.TAG_NAME, "body"))
-                )
-                time.sleep(1)
-                soup = BeautifulSoup(driver.page_source, "html.parser")
-                if should_return:
-                    browser_pool.put(driver)
-                return soup
+                wait_for_page(driver)
+                return parse_page(driver.page_source)
             except Exception as e:
                 if verbose_mode:
                     print(f"Error with browser for {url}: {e}")
-                if should_return and driver:
-                    browser_pool.put(driver)
                 return None
+            finally:
+                if should_return:
+                    return_browser(driver)
     except Exception as e:
         if verbose_mode:
             print(f"Error fetching {url}: {e}")
         return None
 
 
+def page_encoding(response):
+    """Get the encoding of a fetched page, or None to let the parser sniff it
+
+    The Content-Type charset wins, then a charset declared in the page.
+    Without either, lxml would assume Latin-1, so undeclared pages are
+    checked for UTF-8 before falling back to detection.
+    """
+    if "charset" in response.headers.get("content-type", "").lower():
+        return response.encoding
+    if EncodingDetector.find_declared_encoding(response.content, is_html=True):
+        return None
+    try:
+        response.content.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError:
+        return response.apparent_encoding
+
+
+def parse_page(content, encoding=None):
+    """Get the hrefs on a page, parsing large pages in the process pool"""
+    global _parse_pool
+    if len(content) < PROCESS_PARSE_MIN:
+        return parse_hrefs(content, encoding)
+
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            # Spawn rather than fork, the crawl threads are already running
+            _parse_pool = ProcessPoolExecutor(
+                max_workers=os.cpu_count(),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        pool = _parse_pool
+    return pool.submit(parse_hrefs, content, encoding).result()
+
+
+def shutdown_parse_pool():
+    """Stop the parsing processes, if any were started"""
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is not None:
+            _parse_pool.shutdown(cancel_futures=True)
+            _parse_pool = None
+
+
+def parse_hrefs(content, encoding=None):
+    """Get the href of every anchor in an HTML document
+
+    encoding applies to bytes content. When it's None the parser uses the
+    charset declared in the page.
+    """
+    if not LXML_AVAILABLE:
+        soup = BeautifulSoup(
+            content,
+            "html.parser",
+            parse_only=LINK_STRAINER,
+            from_encoding=encoding if isinstance(content, bytes) else None,
+        )
+        return [link["href"] for link in soup.find_all("a", href=True)]
+
+    # Feed the page in pieces, emptying each element once it's parsed, so
+    # large pages never have their whole tree in memory at once
+    hrefs = []
+    if not content.strip():
+        return hrefs
+    if isinstance(content, bytes):
+        parser = etree.HTMLPullParser(events=("end",), encoding=encoding)
+    else:
+        parser = etree.HTMLPullParser(events=("end",))
+
+    def read_links():
+        for _, element in parser.read_events():
+            if element.tag == "a":
+                href = element.get("href")
+                if href is not None:
+                    hrefs.append(href)
+            element.clear(keep_tail=True)
+            # Detach finished siblings too, or their empty shells pile up
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+    for start in range(0, len(content), PARSE_CHUNK):
+        parser.feed(content[start : start + PARSE_CHUNK])
+        read_links()
+    parser.close()
+    read_links()
+    return hrefs
+
+
+@lru_cache(maxsize=None)
 def parse_pattern(pattern_str):
     """Parse a pattern string that may contain fallback patterns separated by '>'
 
     Examples:
-        "*.mp3" -> ["*.mp3"]
-        "*.flac>*.mp3" -> ["*.flac", "*.mp3"]
-        "*.flac>*.ogg>*.mp3" -> ["*.flac", "*.ogg", "*.mp3"]
+        "*.mp3" -> ("*.mp3",)
+        "*.flac>*.mp3" -> ("*.flac", "*.mp3")
+        "*.flac>*.ogg>*.mp3" -> ("*.flac", "*.ogg", "*.mp3")
     """
     if ">" in pattern_str:
-        return [p.strip() for p in pattern_str.split(">")]
-    return [pattern_str]
+        return tuple(p.strip() for p in pattern_str.split(">"))
+    return (pattern_str,)
 
 
-def find_links_with_fallback(soup, base_url, pattern_str):
-    """Find links with fallback pattern support"""
-    if not soup:
-        return []
+@lru_cache(maxsize=None)
+def pattern_extensions(pattern_str):
+    """The href suffix of each fallback pattern, e.g. "*.flac>*.mp3" -> (".flac", ".mp3")"""
+    return tuple(pattern.replace("*", "") for pattern in parse_pattern(pattern_str))
 
-    fallback_patterns = parse_pattern(pattern_str)
 
-    for pattern in fallback_patterns:
-        links = find_links(soup, base_url, pattern)
+def find_links_with_fallback(hrefs, base_url, pattern_str):
+    """Find links with fallback pattern support
+
+    Returns a tuple of (links, pattern that matched), or ([], None).
+    """
+    if not hrefs:
+        return [], None
+
+    fallback_patterns = parse_pattern(pattern_str)
+    if len(fallback_patterns) == 1:
+        links = find_links(hrefs, base_url, pattern_str)
+        return links, pattern_str if links else None
+
+    # Check each href once for all patterns, putting it under the first pattern
+    # it matches. The first non-empty group is the fallback that wins.
+    extensions = pattern_extensions(pattern_str)
+    groups = [set() for _ in fallback_patterns]
+    for href in hrefs:
+        # One C-level check against every suffix rejects most hrefs up front
+        if not href.endswith(extensions):
+            continue
+        for i, extension in enumerate(extensions):
+            if href.endswith(extension):
+                groups[i].add(canonicalize_url(urljoin(base_url, href)))
+                break
+
+    for pattern, links in zip(fallback_patterns, groups):
         if links:
-            if verbose_mode and len(fallback_patterns) > 1:
+            if verbose_mode:
                 print(f"    Using pattern {pattern} (found {len(links)} links)")
-            return links
-        elif verbose_mode and len(fallback_patterns) > 1:
+            return list(links), pattern
+        elif verbose_mode:
             print(f"    No matches for {pattern}, trying fallback...")
 
-    return []
+    return [], None
 
 
-def find_links(soup, base_url, pattern):
+def find_links(hrefs, base_url, pattern):
     """Find all links matching pattern"""
-    if not soup:
+    if not hrefs:
         return []
 
     extension = pattern.replace("*", "")
     links = {
-        urljoin(base_url, link["href"])
-        for link in soup.find_all("a", href=True)
-        if link["href"].endswith(extension)
+        canonicalize_url(urljoin(base_url, href))
+        for href in hrefs
+        if href.endswith(extension)
     }
 
     if links and verbose_mode:
@@ -329,118 +782,217 @@ def find_links(soup, base_url, pattern):
 
 def download_file(url, output_dir):
     """Download a file"""
+    response = None
+    # Names claimed by this download, given back unless the file is written
+    claimed = []
     try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            "Accept": "*/*",
-            "Accept-Language": "en-US,en;q=0.9",
-            "Accept-Encoding": "gzip, deflate, br",
-            "DNT": "1",
-            "Connection": "keep-alive",
-            "Sec-Fetch-Dest": "document",
-            "Sec-Fetch-Mode": "navigate",
-            "Sec-Fetch-Site": "same-origin",
-        }
+        # Skip without contacting the server when the filename in the URL
+        # already exists or is being downloaded. URLs with a query usually
+        # get their real name from Content-Disposition, so those are always
+        # requested.
+        existing = ensure_dir(output_dir)
+        parsed_url = urlparse(url)
+        if not parsed_url.query:
+            guess = _FILENAME_SANITIZE_RE.sub(
+                "_", unquote(os.path.basename(parsed_url.path))
+            )
+            if guess:
+                if not claim_file(existing, guess):
+                    print(f"✓ {guess}")
+                    return True
+                claimed.append(guess)
 
         if verbose_mode:
             print(f"Getting file info for: {os.path.basename(urlparse(url).path)}")
 
-        # Get filename from headers or URL
-        head_response = session.head(
-            url, headers=headers, timeout=30, allow_redirects=True
-        )
-        filename = None
+        # Get filename from headers or URL. By default the headers of the
+        # streaming GET are used, so only one request is made per file.
+        if head_mode:
+            info_response = session.head(
+                url, headers=DOWNLOAD_HEADERS, timeout=30, allow_redirects=True
+            )
+        else:
+            response = session.get(
+                url,
+                headers=DOWNLOAD_HEADERS,
+                stream=True,
+                allow_redirects=True,
+                timeout=60,
+            )
+            response.raise_for_status()
+            info_response = response
 
-        if "content-disposition" in head_response.headers:
-            content_disposition = head_response.headers["content-disposition"]
-            if "filename=" in content_disposition:
-                filename = content_disposition.split("filename=")[1].strip("\"'")
+        filename = None
+        content_disposition = info_response.headers.get("content-disposition", "")
+        if "filename=" in content_disposition:
+            filename = content_disposition.split("filename=")[1].strip("\"'")
 
         if not filename:
-            filename = unquote(os.path.basename(urlparse(url).path))
+            filename = unquote(os.path.basename(urlparse(info_response.url).path))
 
         # Clean filename and ensure it's valid
-        filename = re.sub(r'[<>:"/\\|?*]', "_", filename) or f"file_{int(time.time())}"
+        filename = (
+            _FILENAME_SANITIZE_RE.sub("_", filename) or f"file_{int(time.time())}"
+        )
 
-        os.makedirs(output_dir, exist_ok=True)
         filepath = os.path.join(output_dir, filename)
 
-        if os.path.exists(filepath):
-            print(f"✓ {filename}")
-            return True
+        if filename not in claimed:
+            if not claim_file(existing, filename):
+                print(f"✓ {filename}")
+                return True
+            claimed.append(filename)
 
         print(f"⬇ {filename}")
-        response = session.get(url, headers=headers, stream=True, timeout=60)
-        response.raise_for_status()
 
-        with open(filepath, "wb") as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
+        # Split large files into ranges when the server supports it. Compressed
+        # responses are skipped, their Content-Length isn't the file size.
+        size = int(info_response.headers.get("content-length") or 0)
+        if (
+            download_segments > 1
+            and size >= RANGE_DOWNLOAD_MIN
+            and info_response.headers.get("accept-ranges") == "bytes"
+            and "content-encoding" not in info_response.headers
+            and hasattr(os, "pwrite")
+        ):
+            if response is not None:
+                response.close()
+                response = None
+            try:
+                download_ranges(info_response.url, filepath, size, download_segments)
+                claimed.remove(filename)
+                return True
+            except RangeNotSupported as e:
+                # Fall back to a single stream below
+                if verbose_mode:
+                    print(f"Range download of {filename} failed ({e}), retrying")
+
+        if response is None:
+            response = session.get(
+                url, headers=DOWNLOAD_HEADERS, stream=True, timeout=60
+            )
+            response.raise_for_status()
+
+        # Copy the raw stream straight to disk, letting urllib3 decompress it
+        response.raw.decode_content = True
+        with open(filepath, "wb", buffering=DOWNLOAD_CHUNK) as f:
+            if FADVISE_AVAILABLE:
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            shutil.copyfileobj(response.raw, f, length=DOWNLOAD_CHUNK)
+            f.flush()
+            drop_from_page_cache(f.fileno(), f.tell())
+        claimed.remove(filename)
         return True
 
     except Exception as e:
         print(f"✗ Failed: {os.path.basename(url)} - {e}")
         return False
+    finally:
+        # Release the connection even if the body was skipped or not fully read
+        if response is not None:
+            response.close()
+        for name in claimed:
+            release_file(existing, name)
 
 
-def process_worker(args):
-    """Worker function for concurrent processing"""
-    (
-        link,
-        patterns,
-        depth,
-        mode,
-        output_dir,
-        delay,
-        link_index,
-        total_links,
-        browser_type,
-        title_xpath,
-        base_title,
-    ) = args
+def drop_from_page_cache(fd, size):
+    """Drop a large finished download from the OS page cache
+
+    Downloads aren't read back, so they shouldn't push other data out of
+    memory. Dirty pages can't be dropped, so the file is flushed to disk first.
+    """
+    if not FADVISE_AVAILABLE or size < DROP_CACHE_MIN:
+        return
+    getattr(os, "fdatasync", os.fsync)(fd)
+    os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+class RangeNotSupported(ValueError):
+    """The server advertised byte ranges but didn't serve one as requested"""
+
+
+def download_ranges(url, filepath, size, segments):
+    """Download a file as concurrent byte ranges written into place"""
+    segment_size = -(-size // segments)
+    fd = os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+
+    def fetch_range(start):
+        end = min(start + segment_size, size) - 1
+        # Ask for the bytes as stored, a compressed range can't be written in place
+        headers = {
+            **DOWNLOAD_HEADERS,
+            "Range": f"bytes={start}-{end}",
+            "Accept-Encoding": "identity",
+        }
+        with session.get(url, headers=headers, stream=True, timeout=60) as response:
+            response.raise_for_status()
+            if response.status_code != 206:
+                raise RangeNotSupported(
+                    f"got {response.status_code} for range {start}-{end}"
+                )
+            if response.headers.get("content-encoding", "identity") != "identity":
+                raise RangeNotSupported(
+                    f"range {start}-{end} was sent with "
+                    f"{response.headers['content-encoding']} encoding"
+                )
+            match = _CONTENT_RANGE_RE.match(response.headers.get("content-range", ""))
+            if not match or (int(match[1]), int(match[2])) != (start, end):
+                raise RangeNotSupported(
+                    f"asked for range {start}-{end}, got "
+                    f"{response.headers.get('content-range')!r}"
+                )
+            offset = start
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK):
+                view = memoryview(chunk)
+                while view:
+                    written = os.pwrite(fd, view, offset)
+                    view = view[written:]
+                    offset += written
+        if offset != end + 1:
+            raise ValueError(f"range {start}-{end} ended early at {offset}")
 
-    driver = get_browser(browser_type) if mode in ["chrome", "firefox"] else None
     try:
-        if verbose_mode:
-            clean_name = unquote(os.path.basename(link))
-            print(f"  [{link_index}/{total_links}] Worker processing: {clean_name}")
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(fd, 0, size)
+        else:
+            os.ftruncate(fd, size)
 
-        count = recursive_search(
-            link,
-            patterns,
-            depth + 1,
-            mode,
-            output_dir,
-            delay,
-            1,
-            browser_type,
-            driver,
-            title_xpath,
-            base_title,
-        )
-        return count
-    finally:
-        if driver and mode in ["chrome", "firefox"]:
-            browser_pool.put(driver)
+        # A separate pool, so ranges never wait on busy crawl workers
+        with ThreadPoolExecutor(max_workers=segments) as executor:
+            list(executor.map(fetch_range, range(0, size, segment_size)))
 
+        drop_from_page_cache(fd, size)
+    except Exception:
+        # Don't leave a partial file that a later run would treat as complete
+        os.close(fd)
+        os.remove(filepath)
+        raise
+    os.close(fd)
 
-def recursive_search(
+
+def search_page(
     url,
     patterns,
     depth=0,
     mode="requests",
     output_dir="downloads",
-    delay=1.0,
     max_workers=4,
     browser_type="chrome",
-    driver=None,
     title_xpath=None,
-    base_title=None,
+    progress=None,
 ):
-    """Recursively search and download files"""
+    """Search a page for the first pattern and return the tasks it leads to
+
+    Each task is a (host, function, *args) tuple: a search of a linked page
+    for the remaining patterns, or a download once no patterns remain. host
+    is the host to reserve a request slot for before the task runs, or None.
+    The page must already be claimed with claim_links. progress is printed
+    when the search starts.
+    """
+    if progress:
+        print(progress)
     if not patterns:
-        return 0
+        return []
 
     indent = "  " * depth
     pattern = patterns[0]
@@ -449,159 +1001,219 @@ def recursive_search(
     if verbose_mode:
         print(f"{indent}Searching {url} for {pattern}")
 
-    # Add delay for non-root requests
-    if depth > 0:
-        time.sleep(delay + random.uniform(0, 0.5))
-
-    soup = get_page(url, mode, driver, browser_type)
-    if not soup:
+    hrefs = get_page(url, mode, None, browser_type)
+    if hrefs is None:
         if verbose_mode:
             print(f"{indent}Failed to fetch page")
-        return 0
+        return []
 
     # Extract title if xpath is provided and create appropriate output directory
-    current_output_dir = output_dir
-    current_title = base_title
-
     if title_xpath and depth == 0:
         # Extract title from the current page for the root URL
-        page_title = extract_title(url, title_xpath, mode, driver, browser_type)
+        page_title = extract_title(url, title_xpath, mode, None, browser_type)
         if page_title:
-            current_title = page_title
-            current_output_dir = os.path.join(output_dir, page_title)
+            output_dir = os.path.join(output_dir, page_title)
             if verbose_mode:
                 print(f"{indent}Extracted title: '{page_title}'")
-            print(f"{indent}Output directory: {current_output_dir}")
-    elif depth > 0:
-        # For nested downloads, the output_dir already contains the title path
-        current_output_dir = output_dir
+            print(f"{indent}Output directory: {output_dir}")
 
-    links = find_links_with_fallback(soup, url, pattern)
+    links, used_pattern = find_links_with_fallback(hrefs, url, pattern)
 
-    if not verbose_mode and links:
-        # Show which pattern was actually used for fallback patterns
-        if ">" in pattern:
-            fallback_patterns = parse_pattern(pattern)
-            used_pattern = None
-            # Find which pattern was actually used by checking what links we found
-            for p in fallback_patterns:
-                test_links = find_links(soup, url, p)
-                if test_links:
-                    used_pattern = p
-                    break
-            if used_pattern and used_pattern != fallback_patterns[0]:
-                print(
-                    f"{indent}Found {len(links)} {used_pattern} links (fallback from {fallback_patterns[0]})"
-                )
-            else:
-                print(f"{indent}Found {len(links)} {pattern} links")
-        else:
-            print(f"{indent}Found {len(links)} {pattern} links")
-    elif verbose_mode and links:
+    if verbose_mode and links:
         print(f"{indent}Found {len(links)} links for pattern {pattern}")
+    elif links:
+        # Show which pattern was actually used for fallback patterns
+        primary_pattern = parse_pattern(pattern)[0]
+        fallback_note = (
+            f" (fallback from {primary_pattern})"
+            if used_pattern != primary_pattern
+            else ""
+        )
+        print(f"{indent}Found {len(links)} {used_pattern} links{fallback_note}")
 
+    # Each page is searched for the same patterns, and each file downloaded,
+    # once however many pages link to it. The same page searched for other
+    # patterns is still processed, from the page cache.
+    links = claim_links(links, remaining_patterns, depth + 1)
     if not links:
-        return 0
-
-    download_count = 0
-
-    # Use concurrent processing for multiple links with remaining patterns
-    use_concurrent = len(links) > 1 and remaining_patterns and depth == 0
+        return []
 
-    if use_concurrent:
-        worker_type = "workers" if mode == "requests" else "concurrent browsers"
-        if not verbose_mode:
+    if remaining_patterns:
+        if len(links) > 1 and not verbose_mode:
+            worker_type = "workers" if mode == "requests" else "concurrent browsers"
             print(
                 f"{indent}Processing {len(links)} links with {min(max_workers, len(links))} {worker_type}..."
             )
-
-        worker_args = [
+        return [
             (
+                None if page_cached(link) else urlparse(link).netloc,
+                search_page,
                 link,
                 remaining_patterns,
-                depth,
+                depth + 1,
                 mode,
-                current_output_dir,
-                delay,
-                i + 1,
-                len(links),
+                output_dir,
+                max_workers,
                 browser_type,
-                None,  # Don't pass title_xpath to nested calls
-                current_title,
+                None,  # Only the root page has its title extracted
+                link_progress(depth, i, len(links), link),
             )
-            for i, link in enumerate(links)
+            for i, link in enumerate(links, 1)
         ]
 
-        with ThreadPoolExecutor(max_workers=min(max_workers, len(links))) as executor:
-            futures = [executor.submit(process_worker, args) for args in worker_args]
-            for future in as_completed(futures):
-                try:
-                    download_count += future.result()
-                except Exception as e:
-                    if verbose_mode:
-                        print(f"Worker error: {e}")
-    else:
-        # Check if we should use concurrent downloading for final files
-        use_concurrent_download = (
-            len(links) > 1 and not remaining_patterns and depth == 0 and max_workers > 1
+    if len(links) > 1 and max_workers > 1 and not verbose_mode:
+        print(
+            f"{indent}Downloading {len(links)} files with {min(max_workers, len(links))} download workers..."
         )
+    return [
+        (
+            # Downloads are paced per host like page fetches only when they
+            # run one at a time
+            urlparse(link).netloc if max_workers == 1 else None,
+            download_task,
+            link,
+            output_dir,
+            link_progress(depth, i, len(links), link),
+        )
+        for i, link in enumerate(links, 1)
+    ]
 
-        if use_concurrent_download:
-            worker_type = "download workers"
-            if not verbose_mode:
-                print(
-                    f"{indent}Downloading {len(links)} files with {min(max_workers, len(links))} {worker_type}..."
-                )
 
-            download_args = [(link, current_output_dir) for link in links]
-
-            with ThreadPoolExecutor(
-                max_workers=min(max_workers, len(links))
-            ) as executor:
-                futures = [
-                    executor.submit(download_file, *args) for args in download_args
-                ]
-                for future in as_completed(futures):
-                    try:
-                        if future.result():
-                            download_count += 1
-                    except Exception as e:
-                        if verbose_mode:
-                            print(f"Download error: {e}")
-        else:
-            # Sequential processing
-            for i, link in enumerate(links, 1):
-                clean_name = unquote(os.path.basename(link))
+def claim_links(links, patterns, depth=0):
+    """Claim links for a search for patterns, returning the ones not yet claimed
 
+    Links are claimed for downloading when no patterns remain.
+    """
+    patterns = tuple(patterns)
+    claimed = []
+    with _visited_lock:
+        for link in links:
+            key = (canonicalize_url(link), patterns)
+            if key in _visited:
                 if verbose_mode:
-                    print(f"{indent}[{i}/{len(links)}] Processing: {clean_name}")
-                elif depth == 0:
-                    print(f"[{i}/{len(links)}] {clean_name}")
-
-                if remaining_patterns:
-                    download_count += recursive_search(
-                        link,
-                        remaining_patterns,
-                        depth + 1,
-                        mode,
-                        current_output_dir,
-                        delay,
-                        max_workers,
-                        browser_type,
-                        driver,
-                        None,  # Don't pass title_xpath to nested calls
-                        current_title,
-                    )
-                else:
-                    if download_file(link, current_output_dir):
-                        download_count += 1
+                    print(f"{'  ' * depth}Already queued {link}")
+            else:
+                _visited.add(key)
+                claimed.append(link)
+    return claimed
+
+
+def link_progress(depth, index, total, link):
+    """Get the line printed when a task for a link starts, if any"""
+    clean_name = unquote(os.path.basename(link))
+    if verbose_mode:
+        return f"{'  ' * depth}[{index}/{total}] Processing: {clean_name}"
+    if depth == 0:
+        return f"[{index}/{total}] {clean_name}"
+    return None
+
+
+def download_task(url, output_dir, progress=None):
+    """Download a file found by the crawl, returning 1 if it succeeded"""
+    if progress:
+        print(progress)
+    return 1 if download_file(url, output_dir) else 0
+
+
+def recursive_search(
+    url,
+    patterns,
+    mode="requests",
+    output_dir="downloads",
+    max_workers=4,
+    browser_type="chrome",
+    title_xpath=None,
+    executor=None,
+):
+    """Search pages breadth first and download the files they lead to
+
+    Every page search and download is a task on executor, so the whole
+    crawl frontier shares its workers instead of one level at a time.
+    Searches return the tasks for the links they find, downloads return
+    how many files they saved. Tasks that must wait for a request slot to
+    their host are held here until it opens, rather than sleeping in a
+    worker.
+    """
+    if executor is None:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return recursive_search(
+                url,
+                patterns,
+                mode,
+                output_dir,
+                max_workers,
+                browser_type,
+                title_xpath,
+                executor,
+            )
 
-                time.sleep(0.3 if remaining_patterns else 0.5)
+    # Finished tasks are queued by their done callbacks, so each completion
+    # costs the same however large the frontier is
+    done = queue.Queue()
+    pending = 0
+
+    def submit(fn, *args):
+        nonlocal pending
+        pending += 1
+        executor.submit(fn, *args).add_done_callback(done.put)
+
+    # Tasks waiting for their host's request slot, by start time
+    scheduled = []
+    sequence = itertools.count()
+
+    def schedule(host, fn, *args):
+        delay = rate_limiter.reserve(host) if host else 0
+        if delay > 0:
+            start = time.monotonic() + delay
+            heapq.heappush(scheduled, (start, next(sequence), fn, args))
+        else:
+            submit(fn, *args)
+
+    download_count = 0
+    claim_links([url], patterns)
+    schedule(
+        urlparse(url).netloc,
+        search_page,
+        url,
+        patterns,
+        0,
+        mode,
+        output_dir,
+        max_workers,
+        browser_type,
+        title_xpath,
+    )
+    while pending or scheduled:
+        now = time.monotonic()
+        while scheduled and scheduled[0][0] <= now:
+            _, _, fn, args = heapq.heappop(scheduled)
+            submit(fn, *args)
+        try:
+            future = done.get(timeout=scheduled[0][0] - now if scheduled else None)
+        except queue.Empty:
+            continue
+        pending -= 1
+        try:
+            result = future.result()
+        except Exception as e:
+            if verbose_mode:
+                print(f"Worker error: {e}")
+            continue
+        if isinstance(result, int):
+            download_count += result
+        else:
+            for task in result:
+                schedule(*task)
 
     return download_count
 
 
 def main():
+    # Parse pool workers are spawned and re-run the entry script, which must
+    # not start another crawl even if it calls main() without a guard
+    if multiprocessing.current_process().name != "MainProcess":
+        return
+
     parser = argparse.ArgumentParser(
         description="Recursively download files following link patterns",
         epilog="""
@@ -652,7 +1264,19 @@ Examples:
         "--delay",
         type=float,
         default=float(env.get("DELAY", 1.0)),
-        help="Delay between requests in seconds (default: 1.0)",
+        help="Delay between requests to each host in seconds, per worker (default: 1.0)",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=float(env["RATE"]) if "RATE" in env else None,
+        help="Max requests per second to each host (default: workers/delay)",
+    )
+    parser.add_argument(
+        "--burst",
+        type=int,
+        default=int(env["BURST"]) if "BURST" in env else None,
+        help="Requests allowed to each host in a burst before --rate applies (default: workers)",
     )
     parser.add_argument(
         "--verbose",
@@ -666,7 +1290,21 @@ Examples:
         "-w",
         type=int,
         default=int(env.get("WORKERS", 4)),
-        help="Max concurrent workers/browsers (default: 4)",
+        help="Max concurrent workers/browsers; files over 16 MiB are also "
+        f"fetched as up to {RANGE_SEGMENTS_MAX} parallel ranges each, so one host "
+        "may see workers x that many connections (default: 4)",
+    )
+    parser.add_argument(
+        "--head",
+        action="store_true",
+        default=env.get("HEAD", "false").lower() == "true",
+        help="Send a HEAD request to get the filename before downloading (for servers that need it)",
+    )
+    parser.add_argument(
+        "--js-wait",
+        type=float,
+        default=float(env.get("JS_WAIT", 0)),
+        help="Extra seconds to wait after each browser page load, for sites that render links with JavaScript (default: 0)",
     )
     parser.add_argument(
         "--title",
@@ -679,8 +1317,21 @@ Examples:
     if not args.search:
         raise ValueError("--search argument is required")
 
-    global verbose_mode
+    global verbose_mode, head_mode, js_wait, download_segments
+    global rate_limiter
     verbose_mode = args.verbose
+    head_mode = args.head
+    js_wait = args.js_wait
+    download_segments = min(args.workers, RANGE_SEGMENTS_MAX)
+    # By default every worker gets one request per delay, as when each
+    # worker slept between its own requests
+    if args.rate is None:
+        args.rate = args.workers / args.delay if args.delay > 0 else 0
+    if args.burst is None:
+        args.burst = args.workers
+    rate_limiter = HostRateLimiter(args.rate, args.burst)
+    configure_session(args.workers)
+    install_dns_cache()
 
     print(f"Starting recursive download from: {args.url}")
     print(f"Search patterns: {' -> '.join(args.search)}")
@@ -698,21 +1349,27 @@ Examples:
     print("-" * 50)
 
     try:
-        count = recursive_search(
-            args.url,
-            args.search,
-            mode=args.mode,
-            output_dir=args.output,
-            delay=args.delay,
-            max_workers=args.workers,
-            browser_type=args.mode,
-            title_xpath=args.title if args.title else None,
-        )
+        ensure_dir(args.output)
+        if args.mode in ["chrome", "firefox"]:
+            init_browser_pool(args.workers, args.mode)
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            count = recursive_search(
+                args.url,
+                args.search,
+                mode=args.mode,
+                output_dir=args.output,
+                max_workers=args.workers,
+                browser_type=args.mode,
+                title_xpath=args.title if args.title else None,
+                executor=executor,
+            )
         print(f"\n✅ Completed! Downloaded {count} files to '{args.output}'")
     except KeyboardInterrupt:
         print("\n❌ Interrupted by user")
     finally:
         cleanup_browsers()
+        shutdown_parse_pool()
+        uninstall_dns_cache()
 
 
 if __name__ == "__main__":